@@ -1,67 +1,155 @@
 import streamlit as st
-import json, os, requests
+import os, requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
+import pandas as pd
 import re
-from datetime import datetime
+import hashlib
+import zlib
+import threading
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import google.generativeai as genai
 from pinecone import Pinecone
 from korean_lunar_calendar import KoreanLunarCalendar
-from fpdf import FPDF
+import io
+from xml.sax.saxutils import escape
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 
-# 1. 시스템 초기 설정
+# 1. 시스템 초기 설정 (클라이언트는 세션/재실행 간 하나만 유지)
 load_dotenv()
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index(os.getenv("PINECONE_INDEX_NAME"))
-model = genai.GenerativeModel('gemini-2.0-flash')
-
-# 2. 데이터베이스 로드
-@st.cache_data
-def load_all_databases():
-    dbs = {}
-    f_map = {
-        'ilju': '60ganja.json', 
-        'tojeong': 'tojeong_144_weighted.json', 
-        'sipsin': 'sipsin_data.json', 
-        'gyeok': 'gyeok_data.json', 
-        'unseong': '12unsung.json'
-    }
-    for k, path in f_map.items():
-        if os.path.exists(path):
-            with open(path, 'r', encoding='utf-8') as f:
-                dbs[k] = json.load(f)
-        else:
-            dbs[k] = {}
-    return dbs
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash-lite') # 품질 우선 시 gemini-2.0-flash
+
+@st.cache_resource(show_spinner=False)
+def get_clients():
+    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    return pc.Index(os.getenv("PINECONE_INDEX_NAME")), genai.GenerativeModel(GEMINI_MODEL)
+
+index, model = get_clients()
+
+# 8체질 & 아유르베다 문진 문항
+QUESTIONS = (
+    "1. 육식(고기)을 하면 힘이 나고 소화가 잘 되나요?",
+    "2. 생선이나 해산물을 먹으면 속이 편안한가요?",
+    "3. 땀을 푹 내고 나면 몸이 가벼워지나요?",
+    "4. 땀을 내면 오히려 기운이 빠지고 피곤한가요?",
+    "5. 밀가루 음식(면, 빵)을 먹으면 속이 더부룩한가요?",
+    "6. 찬 우유를 마시면 설사를 하거나 배가 아픈가요?",
+    "7. 사우나나 온탕 목욕을 즐기며 하고 나면 개운한가요?",
+    "8. 평소 대변이 묽은 편이며 하루에 여러 번 보나요?",
+    "9. 성격이 급하고 일 처리를 빨리 끝내야 직성이 풀리나요?",
+    "10. 매사에 신중하고 꼼꼼하며 결정을 내리는 데 시간이 걸리나요?",
+    "11. 일광욕이나 햇볕을 쬐는 것을 좋아하나요?",
+    "12. 피부가 예민하여 금속 알레르기나 아토피가 있나요?",
+    "13. 어깨보다 골격과 하체가 더 발달한 편인가요?",
+    "14. 가슴 윗부분(상체)이 발달하고 걸음걸이가 빠른가요?",
+    "15. 커피를 마시면 잠이 안 오거나 가슴이 두근거리나요?",
+    "16. 술을 조금만 마셔도 얼굴이 심하게 빨개지나요?",
+    "17. 화가 나면 얼굴이 달아오르고 위로 열이 솟구치나요?",
+    "18. 평소 몸이 차고 아랫배가 냉한 느낌이 있나요?",
+    "19. 육식을 끊고 채식만 하면 기운이 없고 무기력해지는 것을 느끼나요?",
+    "20. 매운 음식을 먹으면 땀이 비 오듯 쏟아지나요?",
+    "21. 포도나 푸른 채소를 먹으면 컨디션이 좋아지나요?",
+    "22. 오이나 참외 같은 찬 성질의 과일이 잘 맞나요?",
+    "23. 말수가 적고 조용하며 자신의 속마음을 잘 숨기나요?",
+    "24. 목소리가 크고 화술이 좋아 사교적인 편인가요?",
+    "25. 평소 소화력이 좋아 과식해도 금방 배가 고픈가요?",
+    "26. 생각이 너무 많아 불면증에 시달릴 때가 있나요?",
+    "27. 손발이 항상 따뜻하고 추위를 별로 안 타나요?",
+    "28. 추위를 몹시 타고 찬바람을 맞으면 재채기가 나나요?",
+    "29. 비타민 C를 먹으면 속이 쓰리거나 불편한가요?",
+    "30. 창의적이고 직관적이지만 끈기가 부족한가요?",
+    "31. 한 가지 일에 집요하게 매달리는 집중력이 좋나요?",
+    "32. 물을 많이 마시지 않아도 갈증을 별로 안 느끼나요?",
+)
+ANSWER_OPTS = ("전혀 아니다", "아니다", "그렇다", "매우 그렇다")
+# 프롬프트에는 답변 문장 대신 한 글자 코드만 전달 (문항과 범례는 고정부에 포함)
+ANS_CODE = {"전혀 아니다": "0", "아니다": "1", "그렇다": "2", "매우 그렇다": "3"}
+# 문진 표 초기값 (기존 라디오 버튼과 같이 첫 번째 보기로 시작)
+ANSWER_DF = pd.DataFrame({"질문": QUESTIONS, "답변": [ANSWER_OPTS[0]] * len(QUESTIONS)})
+
+# 프롬프트 고정부 (사용자 데이터보다 앞에 두어 접두어 캐시가 적중하도록 함)
+SYSTEM_PREFIX = (
+    "당신은 데이터 명리학의 거장입니다. [제공 데이터]의 성함을 가진 분을 위한 정밀 분석 보고서를 작성하세요.\n"
+    "[표현 규칙]\n"
+    "- 각 섹션은 350-500자 사이로 간결하게. 불릿 포인트 위주.\n"
+    "- 모든 한자는 반드시 `:orange[**한자**]` 형식을 사용하세요.\n"
+    "[구성] 1.성명학 2.사주정밀해독(재물,부모,직업,배우자,건강) 3.올해운세 4.체질처방\n"
+    "[체질 문항]\n" + "\n".join(QUESTIONS) + "\n"
+    "체질 답변 코드: 0=전혀아니다 1=아니다 2=그렇다 3=매우그렇다, 32글자 순서대로\n"
+)
+# 출력 길이 상한 (모델 한도 8192보다 낮게 설정해 디코딩 시간을 제한)
+# 8개 항목 x 500자 + 제목·한자 표기 ≈ 4,500자 -> 약 3,000~4,500 토큰, 여유분 포함
+GENERATION_CONFIG = genai.GenerationConfig(max_output_tokens=6144)
+
+# 2. 데이터베이스 로드 (필요한 DB만 처음 사용할 때 파싱)
+DB_FILES = {
+    'ilju': '60ganja.json', 
+    'tojeong': 'tojeong_144_weighted.json', 
+    'sipsin': 'sipsin_data.json', 
+    'gyeok': 'gyeok_data.json', 
+    'unseong': '12unsung.json'
+}
+
+@st.cache_resource(show_spinner=False)
+def load_db(key):
+    path = DB_FILES[key]
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
 
-dbs = load_all_databases()
+# 일주 이름(한글) -> 일주 정보 역인덱스, 예: '갑자(甲子)' -> '갑자'
+@st.cache_resource(show_spinner=False)
+def load_ilju_index():
+    return {v.get('ilju', '').split('(')[0]: v for v in load_db('ilju').values()}
 
 # 3. PDF 생성 함수 (bytes 변환 로직 포함)
+_ORANGE_RE = re.compile(r':orange\[\*\*(.*?)\*\*\]')
+
 def generate_pdf(report_text, user_name):
-    pdf = FPDF()
-    pdf.add_page()
-    
     # 폰트 설정 (루트 폴더에 NanumGothic.ttf 파일이 있어야 합니다)
     font_path = "NanumGothic.ttf"
     if os.path.exists(font_path):
-        pdf.add_font("Nanum", "", font_path)
-        pdf.set_font("Nanum", size=11)
+        if "Nanum" not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont("Nanum", font_path))
+        font_name, font_size = "Nanum", 11
     else:
-        pdf.set_font("Arial", size=12) # 폰트 없을 경우 대비
+        font_name, font_size = "Helvetica", 12 # 폰트 없을 경우 대비
+    
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle("ReportTitle", parent=styles['Title'], fontName=font_name, fontSize=font_size + 3)
+    body_style = ParagraphStyle("ReportBody", parent=styles['Normal'], fontName=font_name, fontSize=font_size, leading=font_size * 1.6, wordWrap='CJK')
     
     # 스트림릿 전용 마크다운 문법 제거
-    clean_text = re.sub(r':orange\[\*\*(.*?)\*\*\]', r'\1', report_text)
-    clean_text = clean_text.replace("**", "") 
+    clean_text = _ORANGE_RE.sub(r'\1', report_text).replace("**", "")
     
-    # 제목 작성
-    pdf.cell(0, 10, f"[{user_name}님의 사주·체질 통합 분석 보고서]", ln=True, align='C')
-    pdf.ln(5)
+    # 제목 + 본문 (문단 단위 flowable, Paragraph 마크업 문자는 이스케이프)
+    story = [Paragraph(escape(f"[{user_name}님의 사주·체질 통합 분석 보고서]"), title_style), Spacer(1, 5)]
+    for p in clean_text.split("\n\n"):
+        if p.strip():
+            story.append(Paragraph(escape(p.strip()).replace("\n", "<br/>"), body_style))
+            story.append(Spacer(1, 4))
     
-    # 본문 작성
-    pdf.multi_cell(0, 8, txt=clean_text)
+    buf = io.BytesIO()
+    SimpleDocTemplate(buf, pagesize=A4).build(story)
     
     # 중요: 결과를 명확하게 bytes 형식으로 변환하여 반환
-    return bytes(pdf.output())
+    return buf.getvalue()
+
+# 같은 리포트는 재실행(rerun)마다 다시 렌더링하지 않음 (메모리 상한: 최근 32건, 1시간)
+@st.cache_data(show_spinner=False, max_entries=32, ttl=timedelta(hours=1))
+def generate_pdf_cached(report_text, user_name):
+    return generate_pdf(report_text, user_name)
 
 # 4. 역학 로직 및 데이터 매핑
 ILJU_BRIDGE = {
@@ -71,31 +159,109 @@ ILJU_BRIDGE = {
 }
 
 def get_json_info(ilju_name):
-    ilju_basic = next((v for v in dbs.get('ilju', {}).values() if ilju_name in v.get('ilju', '')), {})
+    ilju_basic = load_ilju_index().get(ilju_name, {})
     bridge = ILJU_BRIDGE.get(ilju_name, {"sipsin": "비견(比肩)", "unseong": "묘(墓)", "gyeok": "건록격(建祿格)"})
-    sipsin_info = dbs.get('sipsin', {}).get(bridge['sipsin'], {})
-    unseong_info = dbs.get('unseong', {}).get(bridge['unseong'], {})
-    gyeok_info = dbs.get('gyeok', {}).get(bridge['gyeok'], "자수성가형 명조")
+    sipsin_info = load_db('sipsin').get(bridge['sipsin'], {})
+    unseong_info = load_db('unseong').get(bridge['unseong'], {})
+    gyeok_info = load_db('gyeok').get(bridge['gyeok'], "자수성가형 명조")
     return ilju_basic, sipsin_info, unseong_info, gyeok_info, bridge
 
+# 일주별 역학 DB 블록 (고정 데이터: SYSTEM_PREFIX 바로 뒤, ---USER DATA--- 구분선 앞에 배치)
+def get_ilju_block(ilju_name):
+    ilju_info, sipsin_info, unseong_info, gyeok_info, _ = get_json_info(ilju_name)
+    return f"[역학 DB] 일주: {ilju_info}, 십신: {sipsin_info}, 운성: {unseong_info}, 격국: {gyeok_info}"
+
+# 토정비결 괘 번호: 상괘(1-8) 중괘(1-6) 하괘(1-3) -> '111'~'863' (144괘)
+def get_tojeong_id(y, m, d):
+    h = zlib.crc32(f"{y}{m:02d}{d:02d}".encode()) % 144
+    return f"{h // 18 + 1}{h // 3 % 6 + 1}{h % 3 + 1}"
+
+# 달력 객체는 한 번만 만들고 공유 (상태를 덮어쓰는 set~조회 구간은 락으로 보호)
+# 잘못된 날짜면 set*Date가 False를 반환하고 이전 상태를 그대로 두므로 반드시 결과를 확인
+@st.cache_resource(show_spinner=False)
+def _lunar_calendar():
+    return KoreanLunarCalendar(), threading.Lock()
+
+# 유효한 날짜의 결과만 캐시 (잘못된 날짜는 예외로 빠져나가므로 저장되지 않음)
+@st.cache_data(show_spinner=False, max_entries=1024)
+def _saju_pillars(y, m, d, h_str, is_lunar):
+    calendar, lock = _lunar_calendar()
+    with lock:
+        if is_lunar: is_valid = calendar.setLunarDate(y, m, d, False)
+        else: is_valid = calendar.setSolarDate(y, m, d)
+        if not is_valid:
+            raise ValueError(f"{y}-{m:02d}-{d:02d}은(는) 존재하지 않는 {'음력' if is_lunar else '양력'} 날짜입니다.")
+        full_gapja = calendar.getGapJaString() 
+    parts = full_gapja.split()
+    return {"year": parts[0].replace('년',''), "month": parts[1].replace('월',''), "day": parts[2].replace('일',''), "hour": h_str}
+
 def get_saju_pillars(y, m, d, h_str, is_lunar=False):
-    calendar = KoreanLunarCalendar()
     try:
-        if is_lunar: calendar.setLunarDate(y, m, d, False)
-        else: calendar.setSolarDate(y, m, d)
-        full_gapja = calendar.getGapJaString() 
-        parts = full_gapja.split()
-        return {"year": parts[0].replace('년',''), "month": parts[1].replace('월',''), "day": parts[2].replace('일',''), "hour": h_str}
-    except: return None
+        return _saju_pillars(y, m, d, h_str, is_lunar)
+    except ValueError as e:
+        st.warning(f"날짜 변환 실패: {e}")
+        return None
+
+# 5. n8n 연동 함수 (백그라운드 전송, 응답을 기다리지 않음)
+N8N_WEBHOOK_URL = "https://n8n.slayself44.uk/webhook-test/saju-save"
+
+# 세션(TCP/TLS 연결 풀)과 전송 스레드는 재실행마다 새로 만들지 않고 공유
+@st.cache_resource(show_spinner=False)
+def _n8n_transport():
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=Retry(total=1, backoff_factor=0.1)))
+    return session, ThreadPoolExecutor(max_workers=2)
+
+_session, _executor = _n8n_transport()
+
+def _post_to_n8n(payload):
+    try:
+        _session.post(N8N_WEBHOOK_URL, json=payload, timeout=5)
+    except requests.RequestException:
+        pass
 
-# 5. n8n 연동 함수
 def sync_to_n8n(action_type, payload):
-    N8N_WEBHOOK_URL = "https://n8n.slayself44.uk/webhook-test/saju-save" 
     payload["action"] = action_type
     payload["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    _executor.submit(_post_to_n8n, payload)
+
+# 6. 리포트 캐시 (동일 입력 재호출 방지, 재시작 후에도 1일간 유지)
+REPORT_CACHE_DB = "report_cache.db"
+REPORT_CACHE_TTL = timedelta(days=1)
+
+def _report_key(key_tuple):
+    return hashlib.sha256(repr(key_tuple).encode('utf-8')).hexdigest()
+
+def _cache_cutoff():
+    return (datetime.now() - REPORT_CACHE_TTL).strftime("%Y-%m-%d %H:%M:%S")
+
+# 테이블 생성은 프로세스당 한 번 (실패하면 캐시되지 않아 다음 호출에서 재시도)
+@st.cache_resource(show_spinner=False)
+def _init_report_cache():
+    with closing(sqlite3.connect(REPORT_CACHE_DB)) as conn, conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS reports (key TEXT PRIMARY KEY, report TEXT, created_at TEXT)")
+
+def load_cached_report(key_tuple):
+    # DB 잠김·읽기 전용 등 캐시 오류는 미적중으로 보고 Gemini 호출로 진행
+    try:
+        _init_report_cache()
+        with closing(sqlite3.connect(REPORT_CACHE_DB)) as conn:
+            row = conn.execute("SELECT report FROM reports WHERE key = ? AND created_at >= ?",
+                               (_report_key(key_tuple), _cache_cutoff())).fetchone()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+def save_cached_report(key_tuple, report_text):
+    # 저장 실패는 무시 (리포트는 이미 화면에 표시되었고 세션 상태에도 저장됨)
     try:
-        requests.post(N8N_WEBHOOK_URL, json=payload, timeout=5)
-    except:
+        _init_report_cache()
+        with closing(sqlite3.connect(REPORT_CACHE_DB)) as conn, conn:
+            # 만료된 리포트(이름·올해운 포함)는 저장 시점에 함께 삭제
+            conn.execute("DELETE FROM reports WHERE created_at < ?", (_cache_cutoff(),))
+            conn.execute("INSERT OR REPLACE INTO reports VALUES (?, ?, ?)",
+                         (_report_key(key_tuple), report_text, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    except sqlite3.Error:
         pass
 
 # --- UI 레이아웃 ---
@@ -126,13 +292,13 @@ with st.container():
 st.write("---")
 
 with st.expander("🧬 8체질 & 아유르베다 정밀 문진", expanded=False):
-    questions = ["1. 육식(고기)을 하면 힘이 나고 소화가 잘 되나요?", "2. 생선이나 해산물을 먹으면 속이 편안한가요?", "3. 땀을 푹 내고 나면 몸이 가벼워지나요?", "4. 땀을 내면 오히려 기운이 빠지고 피곤한가요?", "5. 밀가루 음식(면, 빵)을 먹으면 속이 더부룩한가요?", "6. 찬 우유를 마시면 설사를 하거나 배가 아픈가요?", "7. 사우나나 온탕 목욕을 즐기며 하고 나면 개운한가요?", "8. 평소 대변이 묽은 편이며 하루에 여러 번 보나요?", "9. 성격이 급하고 일 처리를 빨리 끝내야 직성이 풀리나요?", "10. 매사에 신중하고 꼼꼼하며 결정을 내리는 데 시간이 걸리나요?", "11. 일광욕이나 햇볕을 쬐는 것을 좋아하나요?", "12. 피부가 예민하여 금속 알레르기나 아토피가 있나요?", "13. 어깨보다 골격과 하체가 더 발달한 편인가요?", "14. 가슴 윗부분(상체)이 발달하고 걸음걸이가 빠른가요?", "15. 커피를 마시면 잠이 안 오거나 가슴이 두근거리나요?", "16. 술을 조금만 마셔도 얼굴이 심하게 빨개지나요?", "17. 화가 나면 얼굴이 달아오르고 위로 열이 솟구치나요?", "18. 평소 몸이 차고 아랫배가 냉한 느낌이 있나요?", "19. 육식을 끊고 채식만 하면 기운이 없고 무기력해지는 것을 느끼나요?", "20. 매운 음식을 먹으면 땀이 비 오듯 쏟아지나요?", "21. 포도나 푸른 채소를 먹으면 컨디션이 좋아지나요?", "22. 오이나 참외 같은 찬 성질의 과일이 잘 맞나요?", "23. 말수가 적고 조용하며 자신의 속마음을 잘 숨기나요?", "24. 목소리가 크고 화술이 좋아 사교적인 편인가요?", "25. 평소 소화력이 좋아 과식해도 금방 배가 고픈가요?", "26. 생각이 너무 많아 불면증에 시달릴 때가 있나요?", "27. 손발이 항상 따뜻하고 추위를 별로 안 타나요?", "28. 추위를 몹시 타고 찬바람을 맞으면 재채기가 나나요?", "29. 비타민 C를 먹으면 속이 쓰리거나 불편한가요?", "30. 창의적이고 직관적이지만 끈기가 부족한가요?", "31. 한 가지 일에 집요하게 매달리는 집중력이 좋나요?", "32. 물을 많이 마시지 않아도 갈증을 별로 안 느끼나요?"]
-    user_ans = []
-    q_cols = st.columns(2)
-    for i, q in enumerate(questions):
-        with q_cols[i % 2]:
-            a = st.radio(q, ["전혀 아니다", "아니다", "그렇다", "매우 그렇다"], horizontal=True, key=f"q{i}")
-            user_ans.append(f"{q}: {a}")
+    # 32문항을 위젯 하나(표)로 받아 재실행 시 프런트엔드 갱신을 줄임
+    edited = st.data_editor(
+        ANSWER_DF,
+        column_config={"답변": st.column_config.SelectboxColumn(options=ANSWER_OPTS, required=True)},
+        disabled=["질문"], hide_index=True, use_container_width=True, key="answers"
+    )
+    user_ans = [f"{q}: {a}" for q, a in zip(edited['질문'], edited['답변'])]
 
 st.write("---")
 
@@ -147,30 +313,46 @@ if pillars:
             st.warning("분석을 위해 성함을 입력해 주세요.")
         else:
             with st.spinner("방대한 데이터베이스를 융합하여 분석 중입니다..."):
-                ilju_info, sipsin_info, unseong_info, gyeok_info, bridge = get_json_info(ilju_name)
-                tid = f"{(y_val+m_val)%8+1}{(m_val+d_val)%6+1}{(d_val+y_val)%3+1}"
-                tojeong = dbs.get('tojeong', {}).get(tid, {"full_content": ""})['full_content']
+                tid = get_tojeong_id(y_val, m_val, d_val)
+                tojeong = load_db('tojeong').get(tid, {"full_content": ""})['full_content']
 
+                # 백그라운드로 전송되므로 아래 Gemini 호출과 동시에 진행
                 sync_to_n8n("save_user", {
                     "user_id": user_unique_id, "name": u_name, "birth": f"{y_val}-{m_val:02d}-{d_val:02d}",
                     "hour": h_input, "telegram": u_telegram if u_telegram else "미입력", "ilju": ilju_name, "subscribed": "FALSE"
                 })
 
-                prompt = f"""
-                당신은 데이터 명리학의 거장입니다. '{u_name}' 님을 위한 정밀 분석 보고서를 작성하세요.
-                [표현 규칙] 모든 한자는 반드시 `:orange[**한자**]` 형식을 사용하세요.
-                [제공 데이터] 성함: {u_name}, 사주: {pillars}, 일주: {ilju_info}, 십신: {sipsin_info}, 운성: {unseong_info}, 격국: {gyeok_info}, 올해운: {tojeong}, 체질: {user_ans}
-                [구성] 1.성명학 2.사주정밀해독(재물,부모,직업,배우자,건강) 3.올해운세 4.체질처방
-                """
-                report_content = model.generate_content(prompt).text
+                ans_code_str = "".join(ANS_CODE[a] for a in edited['답변'])
+                user_block = f"---USER DATA---\n[제공 데이터] 성함: {u_name}, 사주: {pillars}, 올해운: {tojeong}, 체질: {ans_code_str}"
+                # 프롬프트·모델·생성 설정이 바뀌면 이전 리포트를 재사용하지 않도록 키에 포함
+                key_tuple = (SYSTEM_PREFIX, GEMINI_MODEL, GENERATION_CONFIG, ilju_name, tuple(sorted(pillars.items())), tuple(user_ans), u_hanja, u_name, tid)
+                report_content = load_cached_report(key_tuple)
+                if report_content:
+                    st.markdown(report_content)
+                else:
+                    # 스트리밍으로 받아 생성되는 대로 화면에 표시
+                    stream = model.generate_content([SYSTEM_PREFIX, get_ilju_block(ilju_name), user_block], generation_config=GENERATION_CONFIG, stream=True)
+                    placeholder = st.empty()
+                    buf = []
+                    finish_reason = None
+                    for chunk in stream:
+                        buf.append(chunk.text)
+                        placeholder.markdown("".join(buf))
+                        if chunk.candidates:
+                            finish_reason = chunk.candidates[0].finish_reason
+                    report_content = "".join(buf)
+                    # 정상 종료(STOP)된 리포트만 저장 (길이 제한 등으로 잘린 결과는 캐시하지 않음)
+                    if finish_reason == genai.protos.Candidate.FinishReason.STOP:
+                        save_cached_report(key_tuple, report_content)
+                    elif finish_reason == genai.protos.Candidate.FinishReason.MAX_TOKENS:
+                        st.warning("리포트가 최대 길이에 도달해 끝부분이 잘렸습니다. 다시 생성해 주세요.")
                 st.session_state.generated_report = report_content
-                st.markdown(report_content)
 
     # 리포트가 있을 때만 다운로드 버튼 표시
     if st.session_state.generated_report:
         st.write("---")
         try:
-            pdf_data = generate_pdf(st.session_state.generated_report, u_name)
+            pdf_data = generate_pdf_cached(st.session_state.generated_report, u_name)
             st.download_button(
                 label="📥 분석 보고서 PDF로 저장하기",
                 data=pdf_data,